@@ -8,66 +8,265 @@ import serial.tools.list_ports
 import struct
 import sys
 import time
+import queue
+import threading
+import traceback
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
-from collections import deque
+
+try:
+    from numba import njit
+except ImportError:  # numba 為選用套件，未安裝時改用純 Python 解析
+    njit = None
 
 # 串列埠設定
 BAUD_RATE = 115200
+RX_BUFFER_SIZE = 65536  # OS 層接收緩衝區大小（僅 Windows 可設定）
+READ_TIMEOUT = 0.1      # 讀取執行緒等待資料的逾時（秒）
+
+
+class RingBuffer:
+    """固定容量的 NumPy 環形緩衝區（取代 deque，避免每幀重建 list）"""
+
+    def __init__(self, maxlen, dtype=np.float32):
+        self.maxlen = maxlen
+        self.buf = np.empty(maxlen, dtype=dtype)
+        self._unwrapped = np.empty(maxlen, dtype=dtype)
+        self._unwrapped_idx = -1  # _unwrapped 對應的寫入索引
+        self.idx = 0  # 單調遞增的寫入索引
+
+    def __len__(self):
+        return min(self.idx, self.maxlen)
+
+    def append(self, value):
+        self.buf[self.idx % self.maxlen] = value
+        self.idx += 1
+
+    def extend(self, values):
+        n = len(values)
+        if n > self.maxlen:
+            # 只保留最新的 maxlen 筆
+            self.idx += n - self.maxlen
+            values = values[-self.maxlen:]
+            n = self.maxlen
+        start = self.idx % self.maxlen
+        head = min(n, self.maxlen - start)
+        self.buf[start:start + head] = values[:head]
+        self.buf[:n - head] = values[head:]
+        self.idx += n
+
+    def view(self):
+        """依時間順序回傳連續的陣列（未滿時為零複製切片）"""
+        if self.idx < self.maxlen:
+            return self.buf[:self.idx]
+        if self._unwrapped_idx != self.idx:
+            start = self.idx % self.maxlen
+            np.concatenate((self.buf[start:], self.buf[:start]),
+                           out=self._unwrapped)
+            self._unwrapped_idx = self.idx
+        return self._unwrapped
+
 
 # 資料緩衝區設定
 MAX_SAMPLES = 500
-x_data = deque(maxlen=MAX_SAMPLES)
-y_data = deque(maxlen=MAX_SAMPLES)
-z_data = deque(maxlen=MAX_SAMPLES)
-time_data = deque(maxlen=MAX_SAMPLES)
-timestamp_data = deque(maxlen=MAX_SAMPLES)  # NTP 時間戳記
-
-intensity_history = deque(maxlen=100)
-a_history = deque(maxlen=100)
-intensity_time = deque(maxlen=100)
-intensity_timestamp = deque(maxlen=100)  # NTP 時間戳記
-
-packet_count = {'sensor': 0, 'intensity': 0, 'error': 0}
+x_data = RingBuffer(MAX_SAMPLES)
+y_data = RingBuffer(MAX_SAMPLES)
+z_data = RingBuffer(MAX_SAMPLES)
+time_data = RingBuffer(MAX_SAMPLES, dtype=np.float64)  # 秒，長時間執行需 float64
+
+intensity_history = RingBuffer(100)
+a_history = RingBuffer(100)
+intensity_time = RingBuffer(100, dtype=np.float64)
+
+# 封包格式（含 1 byte header）
+# 感測器: 0x53 + uint64 + 3 個 float = 21 bytes，以結構化 dtype 整批解析
+SENSOR_DT = np.dtype({'names': ['ts', 'x', 'y', 'z'],
+                      'formats': ['<u8', '<f4', '<f4', '<f4'],
+                      'offsets': [1, 9, 13, 17],
+                      'itemsize': 21})
+# 強度: 0x49 + uint64 + 2 個 float = 17 bytes（'x' 跳過 header）
+_INTENSITY = struct.Struct('<xQff')
+
+rx_buf = bytearray()  # 尚未解析的串列埠資料
+
+# 封包統計
+sensor_count = 0
+intensity_count = 0
+error_count = 0
 start_time = time.time()
 first_timestamp = None  # 第一個收到的時間戳記
+last_timestamp = 0      # 最新感測器封包的時間戳記
+last_sample_time = 0.0  # 最新感測器資料的本地時間（秒）
+
+# 讀取執行緒與繪圖共用的緩衝區鎖
+data_lock = threading.Lock()
+reader_running = threading.Event()
+reader_failed = threading.Event()  # 讀取執行緒因非預期錯誤而停止
+
+# 強度資料輸出佇列（由背景執行緒輸出，避免阻塞繪圖）
+LOG_QUEUE_SIZE = 1024
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+# 圖表設定
+XLIM_UPDATE_INTERVAL = 0.5  # X 軸範圍最短更新間隔（秒）
+last_xlim_update = float('-inf')
+plotted_sensor_idx = 0     # 已繪製的感測器資料寫入索引
+plotted_intensity_idx = 0  # 已繪製的強度資料寫入索引
+
+
+def _run_end(buf, i, size):
+    """回傳從 i 開始、與 buf[i] 同 header 的連續完整封包結尾位置"""
+    header_byte = buf[i]
+    n = len(buf)
+    end = i
+    while end + size <= n and buf[end] == header_byte:
+        end += size
+    return end
+
+
+def _parse_sensor(buf, i, packets):
+    """解析連續的感測器封包，回傳下一個位置（不完整時回傳 i）"""
+    global sensor_count
+    end = _run_end(buf, i, SENSOR_DT.itemsize)
+    if end > i:
+        records = np.frombuffer(buf[i:end], dtype=SENSOR_DT)
+        packets.append(('sensor', records['ts'], records['x'],
+                        records['y'], records['z']))
+        sensor_count += len(records)
+    return end
+
+
+def _parse_intensity(buf, i, packets):
+    """解析連續的強度封包，回傳下一個位置（不完整時回傳 i）"""
+    global intensity_count
+    size = _INTENSITY.size
+    end = _run_end(buf, i, size)
+    for fields in _INTENSITY.iter_unpack(buf[i:end]):
+        packets.append(('intensity', *fields))
+    intensity_count += (end - i) // size
+    return end
+
+
+# 依 header byte 查表分派解析函式
+_DISPATCH = [None] * 256
+_DISPATCH[0x53] = _parse_sensor     # 'S' for Sensor
+_DISPATCH[0x49] = _parse_intensity  # 'I' for Intensity
+
+
+def _decode_packets(packets):
+    """以 Python 解析 rx_buf 中的完整封包，回傳已處理的 bytes 數"""
+    global error_count
+
+    i = 0
+    n = len(rx_buf)
+    while i < n:
+        parse = _DISPATCH[rx_buf[i]]
+        if parse is None:
+            # 靜默跳過未知的 header（可能是文字格式或其他資料）
+            error_count += 1
+            i += 1
+            continue
 
+        end = parse(rx_buf, i, packets)
+        if end == i:
+            break  # 封包不完整，等待更多資料
+        i = end
+
+    return i
+
+
+def _scan(buf, sensor_size, intensity_size,
+          out_ts, out_x, out_y, out_z, out_its, out_i, out_a):
+    """掃描 uint8 緩衝區並解碼封包（以 numba 編譯）
+
+    每個封包為 header + uint64 時間戳記 + 連續的 float32 欄位。
+    回傳 (感測器封包數, 強度封包數, 未知 header 數, 已處理的 bytes 數)
+    """
+    n = buf.shape[0]
+    n_sensor = 0
+    n_intensity = 0
+    n_error = 0
+    i = 0
+    while i < n:
+        header_byte = buf[i]
+        if header_byte == 0x53:
+            if i + sensor_size > n:
+                break
+            j = i + 1
+            out_ts[n_sensor] = buf[j:j + 8].view(np.uint64)[0]
+            out_x[n_sensor] = buf[j + 8:j + 12].view(np.float32)[0]
+            out_y[n_sensor] = buf[j + 12:j + 16].view(np.float32)[0]
+            out_z[n_sensor] = buf[j + 16:j + 20].view(np.float32)[0]
+            n_sensor += 1
+            i += sensor_size
+        elif header_byte == 0x49:
+            if i + intensity_size > n:
+                break
+            j = i + 1
+            out_its[n_intensity] = buf[j:j + 8].view(np.uint64)[0]
+            out_i[n_intensity] = buf[j + 8:j + 12].view(np.float32)[0]
+            out_a[n_intensity] = buf[j + 12:j + 16].view(np.float32)[0]
+            n_intensity += 1
+            i += intensity_size
+        else:
+            n_error += 1
+            i += 1
+    return n_sensor, n_intensity, n_error, i
 
-def parse_serial_data(ser):
-    """解析串列埠資料"""
-    try:
-        header = ser.read(1)
-        if len(header) != 1:
-            return None
 
-        header_byte = header[0]
-
-        if header_byte == 0x53:  # 'S' for Sensor
-            # 讀取 20 bytes (1 個 uint64 + 3 個 float)
-            data = ser.read(20)
-            if len(data) == 20:
-                timestamp, x, y, z = struct.unpack('<Qfff', data)
-                packet_count['sensor'] += 1
-                return ('sensor', timestamp, x, y, z)
-
-        elif header_byte == 0x49:  # 'I' for Intensity
-            # 讀取 16 bytes (1 個 uint64 + 2 個 float)
-            data = ser.read(16)
-            if len(data) == 16:
-                timestamp, intensity, a = struct.unpack('<Qff', data)
-                packet_count['intensity'] += 1
-                return ('intensity', timestamp, intensity, a)
-        else:
-            # 靜默跳過未知的 header（可能是文字格式或其他資料）
-            packet_count['error'] += 1
-            return None
+if njit is not None:
+    _scan = njit(cache=True)(_scan)
+
+_scan_out = None  # _scan 的輸出陣列，容量不足時才重新配置
 
-    except Exception as e:
-        packet_count['error'] += 1
-        # 只在錯誤嚴重時才輸出
-        if packet_count['error'] % 100 == 0:
-            print(f"Error: {e} (總共 {packet_count['error']} 個錯誤)")
-        return None
+
+def _decode_packets_jit(packets):
+    """以編譯後的 _scan 解析 rx_buf，回傳已處理的 bytes 數"""
+    global sensor_count, intensity_count, error_count, _scan_out
+
+    capacity = len(rx_buf) // _INTENSITY.size + 1
+    if _scan_out is None or len(_scan_out[0]) < capacity:
+        capacity *= 2  # 預留空間，減少重新配置
+        _scan_out = (np.empty(capacity, dtype=np.uint64),
+                     np.empty(capacity, dtype=np.float32),
+                     np.empty(capacity, dtype=np.float32),
+                     np.empty(capacity, dtype=np.float32),
+                     np.empty(capacity, dtype=np.uint64),
+                     np.empty(capacity, dtype=np.float32),
+                     np.empty(capacity, dtype=np.float32))
+    ts, x, y, z, its, intensity, a = _scan_out
+
+    buf = np.frombuffer(rx_buf, dtype=np.uint8)
+    n_sensor, n_intensity, n_error, consumed = _scan(
+        buf, SENSOR_DT.itemsize, _INTENSITY.size,
+        ts, x, y, z, its, intensity, a)
+    del buf  # 釋放 rx_buf 的 buffer，之後才能截斷
+
+    # 輸出陣列會在下次呼叫時覆寫，drain_serial 須在此之前寫入環形緩衝區
+    if n_sensor > 0:
+        packets.append(('sensor', ts[:n_sensor], x[:n_sensor],
+                        y[:n_sensor], z[:n_sensor]))
+    for k in range(n_intensity):
+        packets.append(('intensity', int(its[k]), float(intensity[k]),
+                        float(a[k])))
+
+    sensor_count += n_sensor
+    intensity_count += n_intensity
+    error_count += n_error
+    return consumed
+
+
+_decode = _decode_packets_jit if njit is not None else _decode_packets
+
+
+def parse_serial_data(ser):
+    """批次讀取串列埠資料，解析緩衝區內所有完整的封包"""
+    packets = []
+    # 一次取出所有已到達的資料；沒有資料時等待至少 1 byte
+    rx_buf.extend(ser.read(ser.in_waiting or 1))
+    del rx_buf[:_decode(packets)]
+    return packets
 
 
 def list_serial_ports():
@@ -120,32 +319,43 @@ def select_serial_port():
             return None
 
 
-def update_plot(frame, ser, lines):
-    """更新圖表"""
-    global start_time, first_timestamp
-    from datetime import datetime
+def drain_serial(ser):
+    """讀取並解析一批串列埠資料，寫入環形緩衝區"""
+    global first_timestamp, last_timestamp, last_sample_time
 
-    current_time = time.time() - start_time  # 在迴圈外定義
+    packets = parse_serial_data(ser)
+    current_time = time.time() - start_time  # 整批只取一次時間
 
-    for _ in range(10):
-        result = parse_serial_data(ser)
-        if result is None:
-            continue
-
-        current_time = time.time() - start_time  # 更新時間
+    # 本批最新的感測器時間戳記，對齊 current_time
+    newest = next((int(result[1][-1]) for result in reversed(packets)
+                   if result[0] == 'sensor'), None)
 
+    for result in packets:
         if result[0] == 'sensor':
+            # 同一批連續的感測器封包，各欄位皆為陣列
             _, timestamp, x, y, z = result
 
             # 儲存第一個時間戳記作為參考
-            if first_timestamp is None and timestamp > 0:
-                first_timestamp = timestamp
+            if first_timestamp is None:
+                synced = timestamp[timestamp > 0]
+                if len(synced) > 0:
+                    first_timestamp = int(synced[0])
+
+            # 以 NTP 時間戳記推算每筆資料的本地時間
+            if 0 < timestamp[0] <= timestamp[-1] <= newest:
+                # 以 uint64 相減，避免錯誤對齊的超大時間戳記溢位
+                lag = (np.uint64(newest) - timestamp).astype(np.float64)
+                t = current_time - lag * 1e-3
+                np.maximum(t, last_sample_time, out=t)  # 不早於上一批
+            else:
+                t = np.full(len(x), current_time)
 
-            x_data.append(x)
-            y_data.append(y)
-            z_data.append(z)
-            time_data.append(current_time)
-            timestamp_data.append(timestamp)
+            with data_lock:
+                x_data.extend(x)
+                y_data.extend(y)
+                z_data.extend(z)
+                time_data.extend(t)
+            last_timestamp = int(timestamp[-1])
 
         elif result[0] == 'intensity':
             _, timestamp, intensity, a = result
@@ -154,67 +364,129 @@ def update_plot(frame, ser, lines):
             if first_timestamp is None and timestamp > 0:
                 first_timestamp = timestamp
 
-            intensity_history.append(intensity)
-            a_history.append(a)
-            intensity_time.append(current_time)
-            intensity_timestamp.append(timestamp)
-
-            # 轉換時間戳記為可讀格式
-            if timestamp > 0:
-                dt = datetime.fromtimestamp(timestamp / 1000.0)
-                time_str = dt.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-            else:
-                time_str = f"{int(current_time):04d}s (No NTP)"
+            with data_lock:
+                intensity_history.append(intensity)
+                a_history.append(a)
+                intensity_time.append(current_time)
 
-            print(f"[{time_str}] I: {intensity:.2f}, a: {a:.2f} Gal")
+            try:
+                log_queue.put_nowait((timestamp, intensity, a, current_time))
+            except queue.Full:
+                pass  # 輸出跟不上時丟棄，不影響繪圖
 
-    if len(time_data) > 0:
-        lines[0].set_data(list(time_data), list(x_data))
-        lines[1].set_data(list(time_data), list(y_data))
-        lines[2].set_data(list(time_data), list(z_data))
+    if newest is not None:
+        last_sample_time = current_time
 
-    if len(intensity_time) > 0:
-        lines[3].set_data(list(intensity_time), list(intensity_history))
-        lines[4].set_data(list(intensity_time), list(a_history))
 
-    # 自動調整 X 軸範圍
-    for ax in [ax1, ax2]:
-        if len(time_data) > 0:
-            ax.set_xlim(max(0, current_time - 10), current_time + 1)
+def serial_reader(ser):
+    """背景執行緒：持續讀取串列埠直到程式結束"""
+    global error_count
+    while reader_running.is_set():
+        try:
+            drain_serial(ser)
+        except OSError as e:  # 含 SerialException 與拔除裝置時的 EIO
+            error_count += 1
+            # 只在錯誤嚴重時才輸出（每 128 個錯誤一次）
+            if (error_count & 127) == 0:
+                print(f"Error: {e} (總共 {error_count} 個錯誤)")
+            time.sleep(READ_TIMEOUT)  # 避免裝置異常時空轉
+        except Exception:
+            # 非預期錯誤：輸出 traceback 並停止讀取，由 update_plot 關閉視窗
+            print("\n✗ 讀取執行緒發生錯誤，停止接收資料:")
+            traceback.print_exc()
+            reader_failed.set()
+            reader_running.clear()
+            return
+
+
+def update_plot(frame, lines):
+    """更新圖表（只讀取環形緩衝區，串列埠由 serial_reader 處理）"""
+    global last_xlim_update, plotted_sensor_idx, plotted_intensity_idx
+
+    if reader_failed.is_set():
+        plt.close(ax1.figure)  # 不再有新資料，關閉視窗以結束程式
+        return lines
+
+    current_time = time.time() - start_time
+
+    with data_lock:
+        # 只在有新資料時更新線條，避免 Matplotlib 重新轉換相同的陣列
+        if time_data.idx != plotted_sensor_idx:
+            plotted_sensor_idx = time_data.idx
+            t = time_data.view()
+            lines[0].set_data(t, x_data.view())
+            lines[1].set_data(t, y_data.view())
+            lines[2].set_data(t, z_data.view())
+
+        if intensity_time.idx != plotted_intensity_idx:
+            plotted_intensity_idx = intensity_time.idx
+            t = intensity_time.view()
+            lines[3].set_data(t, intensity_history.view())
+            lines[4].set_data(t, a_history.view())
+
+    # 自動調整 X 軸範圍（改變範圍會使 blit 的背景快取失效，因此限制更新頻率）
+    if (plotted_sensor_idx > 0
+            and current_time - last_xlim_update >= XLIM_UPDATE_INTERVAL):
+        last_xlim_update = current_time
+        ax1.set_xlim(max(0, current_time - 10), current_time + 1)  # ax2 共用 X 軸
 
     return lines
 
 
+_localtime = time.localtime  # 供 format_timestamp 使用，省去屬性查找
+
+
+def format_timestamp(timestamp):
+    """將毫秒時間戳記格式化為本地時間 YYYY-MM-DD HH:MM:SS.mmm"""
+    sec, ms = divmod(timestamp, 1000)
+    try:
+        t = _localtime(sec)
+    except (OverflowError, OSError, ValueError):
+        # 超出平台可轉換範圍（例如錯誤對齊的封包）
+        return f"{timestamp} ms"
+    return (f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} "
+            f"{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}.{ms:03d}")
+
+
+def log_writer():
+    """背景執行緒：格式化並輸出強度資料"""
+    while True:
+        timestamp, intensity, a, current_time = log_queue.get()
+        try:
+            # 轉換時間戳記為可讀格式
+            if timestamp > 0:
+                time_str = format_timestamp(timestamp)
+            else:
+                time_str = f"{int(current_time):04d}s (No NTP)"
+
+            sys.stdout.write(
+                f"[{time_str}] I: {intensity:.2f}, a: {a:.2f} Gal\n")
+        finally:
+            log_queue.task_done()  # 確保 main() 的 log_queue.join() 能結束
+
+
 def print_statistics():
     """顯示統計"""
-    from datetime import datetime
-
     elapsed = time.time() - start_time
     print("\n" + "="*60)
     print(f"執行時間: {elapsed:.1f} 秒")
 
     if elapsed > 0:
+        print(f"感測器封包: {sensor_count} ({sensor_count/elapsed:.1f} Hz)")
         print(
-            f"感測器封包: {packet_count['sensor']} ({packet_count['sensor']/elapsed:.1f} Hz)")
-        print(
-            f"強度封包: {packet_count['intensity']} ({packet_count['intensity']/elapsed:.1f} Hz)")
-        print(f"錯誤封包: {packet_count['error']}")
+            f"強度封包: {intensity_count} ({intensity_count/elapsed:.1f} Hz)")
+        print(f"錯誤封包: {error_count}")
 
     # 顯示時間戳記資訊
     if first_timestamp is not None and first_timestamp > 0:
-        dt = datetime.fromtimestamp(first_timestamp / 1000.0)
-        print(f"\n首次時間戳記: {dt.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}")
-
-        if len(timestamp_data) > 0:
-            latest = timestamp_data[-1]
-            if latest > 0:
-                dt_latest = datetime.fromtimestamp(latest / 1000.0)
-                print(
-                    f"最新時間戳記: {dt_latest.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}")
-
-                # 計算時間跨度
-                duration_ms = latest - first_timestamp
-                print(f"資料時間跨度: {duration_ms / 1000.0:.2f} 秒")
+        print(f"\n首次時間戳記: {format_timestamp(first_timestamp)}")
+
+        if last_timestamp > 0:
+            print(f"最新時間戳記: {format_timestamp(last_timestamp)}")
+
+            # 計算時間跨度
+            duration_ms = last_timestamp - first_timestamp
+            print(f"資料時間跨度: {duration_ms / 1000.0:.2f} 秒")
     else:
         print("\n⚠ 未接收到有效的 NTP 時間戳記")
 
@@ -234,7 +506,9 @@ def main():
         sys.exit(0)
 
     try:
-        ser = serial.Serial(selected_port, BAUD_RATE, timeout=1)
+        ser = serial.Serial(selected_port, BAUD_RATE, timeout=READ_TIMEOUT)
+        if sys.platform == 'win32':
+            ser.set_buffer_size(rx_size=RX_BUFFER_SIZE)
         print(f"\n✓ 已連接: {selected_port} @ {BAUD_RATE} baud")
     except serial.SerialException as e:
         print(f"\n✗ 錯誤: {e}")
@@ -249,7 +523,12 @@ def main():
         pass
 
     plt.style.use('dark_background')
+    # 路徑簡化與分段繪製，降低即時繪圖成本
+    plt.rcParams['path.simplify'] = True
+    plt.rcParams['path.simplify_threshold'] = 1.0
+    plt.rcParams['agg.path.chunksize'] = 10000
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
+    ax2.sharex(ax1)
 
     ax1.set_title('三軸加速度 (Gal)', fontsize=14, fontweight='bold')
     ax1.set_ylabel('加速度 (Gal)')
@@ -271,11 +550,17 @@ def main():
     ax2.set_ylim(-1, 7)
 
     lines = [line_x, line_y, line_z, line_i, line_a]
+    for line in lines:
+        line.set_antialiased(False)  # 細線即時波形不需要反鋸齒
     plt.tight_layout()
 
     print("\n開始接收資料...\n")
+    threading.Thread(target=log_writer, daemon=True).start()
+    reader_running.set()
+    reader = threading.Thread(target=serial_reader, args=(ser,), daemon=True)
+    reader.start()
 
-    ani = FuncAnimation(fig, update_plot, fargs=(ser, lines),
+    ani = FuncAnimation(fig, update_plot, fargs=(lines,),
                         interval=50, blit=True, cache_frame_data=False)
 
     try:
@@ -283,6 +568,9 @@ def main():
     except KeyboardInterrupt:
         print("\n程式終止")
     finally:
+        reader_running.clear()
+        reader.join()
+        log_queue.join()  # 先輸出完剩餘的強度資料
         print_statistics()
         ser.close()
         print("串列埠已關閉")